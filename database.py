@@ -1,7 +1,80 @@
 from abc import abstractmethod
-from typing import Dict, List
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+import numpy as np
 import polars as pl
 
+logger = logging.getLogger(__name__)
+
+
+# FNDDS column names, with line breaks in the headers collapsed to single spaces
+_FOOD_CODE = "Food code"
+_FOOD_NAME = "Main food description"
+_FOOD_COLUMNS = (
+    _FOOD_CODE,
+    _FOOD_NAME,
+    "WWEIA Category number",
+    "WWEIA Category description",
+)
+_SEQ_NUM = "Seq num"
+_PORTION_DESCRIPTION = "Portion description"
+
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "joseph")
+# bump whenever the parsing of the source files changes, so that stale caches are not served
+_CACHE_VERSION = 1
+
+# derived columns
+_ALIAS = "alias"
+_UNIT = "unit"
+
+
+def _read_fndds_table(file_path: str) -> pl.DataFrame:
+    """
+    Read an FNDDS table from its `.xlsx` workbook or its exported `.csv` sheet.
+    Both start with a title row above the actual header.
+    """
+    if file_path.endswith(".xlsx"):
+        df = pl.read_excel(file_path, read_options={"header_row": 1})
+    else:
+        df = pl.read_csv(file_path, skip_rows=1, infer_schema_length=None)
+
+    return df.rename(lambda column: " ".join(column.split()))
+
+
+def _cache_key(*file_paths: str, column_major: bool = False) -> str:
+    """
+    Key the parsed state of a set of source files by their paths and modification times,
+    so that editing a source file invalidates its cache. The layout of the nutrient matrix is
+    part of the key, so that a cached matrix is always memory mapped in the requested layout.
+    """
+    parts = [f"v{_CACHE_VERSION}", "F" if column_major else "C"]
+    for file_path in file_paths:
+        if file_path is None:
+            parts.append("")
+        else:
+            parts.append(f"{os.path.abspath(file_path)}:{os.path.getmtime(file_path)}")
+
+    return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+def _write_atomic(file_path: str, write):
+    """
+    Call `write` on a temporary file next to `file_path` and move it into place.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
 class FoodDataAPI(object):
     ###################################
@@ -9,9 +82,10 @@ class FoodDataAPI(object):
     ###################################
     @property
     @abstractmethod
-    def nutrient_header(self) -> list:
+    def nutrient_header(self) -> tuple:
         """
-        Get a list of nutrient names as header for the nutrient values returned by get_food_nutrient_series
+        Get a tuple of nutrient names as header for the nutrient values returned by get_food_nutrient_series.
+        Callers that need a mutable list should copy it with `list(api.nutrient_header)`.
         """
         pass
     
@@ -55,6 +129,28 @@ class FoodDataAPI(object):
         """
         pass
 
+    @abstractmethod
+    def get_food_nutrient_matrix(self, food_codes: List[int]) -> np.ndarray:
+        """
+        Get the nutrient values of many food codes at once, one row per food code.
+        The columns are the nutrient header returned by the method `nutrient_header`.
+        """
+        pass
+
+    @abstractmethod
+    def get_food_nutrient_matrix_by_alias(self, aliases: List[str]) -> np.ndarray:
+        """
+        Same as `get_food_nutrient_matrix`, but for a list of aliases.
+        """
+        pass
+
+    @abstractmethod
+    def get_nutrient_column(self, nutrient: str) -> np.ndarray:
+        """
+        Get the values of one nutrient for all foods, in the row order of `get_food_nutrient_matrix`.
+        """
+        pass
+
 
 class FnddsAPI(FoodDataAPI):
     """
@@ -65,36 +161,89 @@ class FnddsAPI(FoodDataAPI):
             self,
             nutrient_values_file_path: str = None,
             portions_and_weight_file_path: str = None,
+            use_cache: bool = True,
+            column_major: bool = False,
         ):
         """
         Initialize the FoodDBAPI class.
+
+        With `use_cache`, the parsed lookup maps and nutrient matrix are saved under
+        `~/.cache/joseph` on first load and read back from there on later loads of the same,
+        unmodified files. The nutrient matrix is then memory mapped read-only, and
+        `nutrient_values_df`/`portions_and_weight_df` are left as None since the source files
+        are not parsed.
+
+        The nutrient matrix is float32, row-major by default. Use `column_major` if queries
+        mostly read one nutrient across many foods (see `get_nutrient_column`).
         """
 
         self._alias_to_food_code: Dict[str:int] = None
         self._food_code_to_food_name: Dict[int:str] = None
         self._food_name_to_alias: Dict[str:str] = None
-        self._nutrient_header: List[str] = None
+        self._nutrient_header: Tuple[str, ...] = None
         self._food_unit_by_food_code: Dict[int:str] = None
+        self._food_code_to_row: Dict[int:int] = None
+        self._nutrient_matrix: np.ndarray = None
+
+        # composed maps so every public lookup is a single dict.get
+        self._alias_to_food_name: Dict[str:str] = None
+        self._food_name_to_food_code: Dict[str:int] = None
+        self._food_code_to_alias: Dict[int:str] = None
+        self._alias_to_row: Dict[str:int] = None
+        self._nutrient_to_column: Dict[str:int] = None
+        self._food_unit_by_alias: Dict[str:str] = None
+        self._food_unit_by_food_name: Dict[str:str] = None
 
         self.nutrient_values_df: pl.DataFrame = None
         self.portions_and_weight_df: pl.DataFrame = None
 
+        cache_path = None
+        if use_cache and (nutrient_values_file_path is not None or portions_and_weight_file_path is not None):
+            cache_path = os.path.join(
+                _CACHE_DIR,
+                _cache_key(nutrient_values_file_path, portions_and_weight_file_path, column_major=column_major),
+            )
+
+        if cache_path is None or not self._load_cache(cache_path):
+            if nutrient_values_file_path is not None:
+                self.nutrient_values_df = _read_fndds_table(nutrient_values_file_path)
+                self._load_nutrient_values()
+                if column_major:
+                    self._nutrient_matrix = np.asfortranarray(self._nutrient_matrix)
+                else:
+                    self._nutrient_matrix = np.ascontiguousarray(self._nutrient_matrix)
+            if portions_and_weight_file_path is not None:
+                self.portions_and_weight_df = _read_fndds_table(portions_and_weight_file_path)
+                self._load_portions_and_weight()
+            if cache_path is not None:
+                self._save_cache(cache_path)
+
+        if self._nutrient_matrix is not None:
+            # the layout is applied before saving the cache, so a cached matrix is used as is.
+            # read-only whether parsed or memory mapped from the cache, so views handed out by
+            # the API cannot modify it
+            self._nutrient_matrix.flags.writeable = False
+            self._nutrient_to_column = dict(zip(self._nutrient_header, range(len(self._nutrient_header))))
+
+        if self._alias_to_food_code is not None:
+            self._build_lookup_maps()
+
     
     ###################################
     # methods supplied by the API
     ###################################
     @property
-    def nutrient_header(self) -> list:
-        return list(self._nutrient_header)
+    def nutrient_header(self) -> tuple:
+        return self._nutrient_header
     
     def get_food_code(self, alias: str = None, food_name: str = None) -> int:
         """
         Get the food code for a given alias or food name.
         """
-        if alias:
+        if alias is not None:
             return self._alias_to_food_code.get(alias)
-        if food_name:
-            return self._alias_to_food_code.get(self._food_name_to_alias.get(food_name))
+        if food_name is not None:
+            return self._food_name_to_food_code.get(food_name)
         raise ValueError("Either alias or food_name must be provided.")
 
     def get_food_name(self, alias: str = None, food_code: int = None) -> str:
@@ -102,7 +251,7 @@ class FnddsAPI(FoodDataAPI):
         Get the food name for a given alias or food code.
         """
         if alias is not None:
-            return self._food_code_to_food_name.get(self._alias_to_food_code.get(alias))
+            return self._alias_to_food_name.get(alias)
         elif food_code is not None:
             return self._food_code_to_food_name.get(food_code)
         else:
@@ -113,17 +262,20 @@ class FnddsAPI(FoodDataAPI):
         Get the food alias for a given food code or food name.
         """
         if food_code is not None:
-            return self._food_name_to_alias.get(self._food_code_to_food_name.get(food_code))
+            return self._food_code_to_alias.get(food_code)
         elif food_name is not None:
             return self._food_name_to_alias.get(food_name)
         else:
             raise ValueError("Either food_code or food_name must be provided.")
 
     def get_food_unit(self, alist: str = None, food_code: int = None, food_name: str = None) -> str:
-        if food_code is None:
-            food_code = self.get_food_code(alias=alist, food_name=food_name)
-        
-        return self._food_unit_by_food_code.get(food_code)
+        if food_code is not None:
+            return self._food_unit_by_food_code.get(food_code)
+        if alist is not None:
+            return self._food_unit_by_alias.get(alist)
+        if food_name is not None:
+            return self._food_unit_by_food_name.get(food_name)
+        raise ValueError("Either alist, food_code or food_name must be provided.")
 
     def get_food_nutrient_series(self, alias: str = None, food_code: int = None, food_name: str = None) -> pl.Series:
         """
@@ -133,4 +285,181 @@ class FnddsAPI(FoodDataAPI):
             food_code = self.get_food_code(alias=alias, food_name=food_name)
         
         return self._get_food_nutrient_series(food_code)
-    
+
+    def get_food_nutrient_matrix(self, food_codes: List[int]) -> np.ndarray:
+        """
+        Get the nutrient values of many food codes at once with a single gather from the
+        nutrient matrix. Raises KeyError on an unknown food code.
+        """
+        rows = np.fromiter(
+            (self._food_code_to_row[code] for code in food_codes), dtype=np.int64, count=len(food_codes)
+        )
+        return self._nutrient_matrix[rows]
+
+    def get_food_nutrient_matrix_by_alias(self, aliases: List[str]) -> np.ndarray:
+        """
+        Get the nutrient values of many aliases at once. Raises KeyError on an unknown alias.
+        """
+        rows = np.fromiter(
+            (self._alias_to_row[alias] for alias in aliases), dtype=np.int64, count=len(aliases)
+        )
+        return self._nutrient_matrix[rows]
+
+    def get_nutrient_column(self, nutrient: str) -> np.ndarray:
+        """
+        Get the values of one nutrient for all foods as a view of the nutrient matrix, which is
+        contiguous if the matrix is column major. Raises KeyError on an unknown nutrient.
+        """
+        return self._nutrient_matrix[:, self._nutrient_to_column[nutrient]]
+
+    ###################################
+    # internal helpers
+    ###################################
+    # parsed state persisted by the cache, next to the nutrient matrix
+    _CACHED_ATTRIBUTES = (
+        "_alias_to_food_code",
+        "_food_code_to_food_name",
+        "_food_name_to_alias",
+        "_nutrient_header",
+        "_food_unit_by_food_code",
+        "_food_code_to_row",
+    )
+
+    def _load_cache(self, cache_path: str) -> bool:
+        """
+        Restore the parsed state from `{cache_path}.pkl` and `{cache_path}.npy`.
+        Returns False if there is no cache to restore from, or if it cannot be read, in which
+        case the source files are parsed again and the cache is rewritten.
+        """
+        if not os.path.exists(f"{cache_path}.pkl"):
+            return False
+
+        try:
+            with open(f"{cache_path}.pkl", "rb") as f:
+                state = pickle.load(f)
+            attributes = {name: state[name] for name in self._CACHED_ATTRIBUTES}
+            nutrient_matrix = None
+            if state["has_nutrient_matrix"]:
+                nutrient_matrix = np.load(f"{cache_path}.npy", mmap_mode="r")
+        except Exception:
+            logger.warning("Ignoring unreadable cache %s", cache_path, exc_info=True)
+            return False
+
+        for name, value in attributes.items():
+            setattr(self, name, value)
+        self._nutrient_matrix = nutrient_matrix
+
+        return True
+
+    def _save_cache(self, cache_path: str):
+        """
+        Save the parsed state to `{cache_path}.pkl` and `{cache_path}.npy`. Each file is written
+        to a temporary file and moved into place, so that readers never see a partial file, and
+        the matrix is written first, so that a cache with a `.pkl` file is always complete.
+        """
+        state = {name: getattr(self, name) for name in self._CACHED_ATTRIBUTES}
+        state["has_nutrient_matrix"] = self._nutrient_matrix is not None
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            if self._nutrient_matrix is not None:
+                _write_atomic(f"{cache_path}.npy", lambda f: np.save(f, self._nutrient_matrix))
+            _write_atomic(
+                f"{cache_path}.pkl",
+                lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+        except OSError:
+            logger.warning("Could not write cache %s", cache_path, exc_info=True)
+
+    def _load_nutrient_values(self):
+        """
+        Build the food code, food name and alias maps from `nutrient_values_df`.
+        The alias of a food is its lower cased food name.
+
+        Names and aliases are interned, so that all maps share one str object per value
+        and key comparisons short-circuit on identity.
+        """
+        df = self.nutrient_values_df
+        # one Arrow -> Python conversion for all key columns
+        columns = df.select(
+            _FOOD_CODE,
+            _FOOD_NAME,
+            pl.col(_FOOD_NAME).str.to_lowercase().alias(_ALIAS),
+        ).to_dict(as_series=False)
+        food_codes = columns[_FOOD_CODE]
+        food_names = [sys.intern(name) for name in columns[_FOOD_NAME]]
+        aliases = [sys.intern(alias) for alias in columns[_ALIAS]]
+
+        self._food_code_to_food_name = dict(zip(food_codes, food_names))
+        self._food_name_to_alias = dict(zip(food_names, aliases))
+        self._alias_to_food_code = dict(zip(aliases, food_codes))
+        self._nutrient_header = tuple(column for column in df.columns if column not in _FOOD_COLUMNS)
+
+        # dense (food, nutrient) matrix so a food's nutrients are a single row slice
+        self._food_code_to_row = dict(zip(food_codes, range(len(food_codes))))
+        self._nutrient_matrix = (
+            df.select(list(self._nutrient_header)).to_numpy().astype(np.float32, copy=False)
+        )
+
+    def _get_food_nutrient_series(self, food_code: int) -> pl.Series:
+        """
+        Get the nutrient series of a food code from its row of the nutrient matrix.
+        Returns None for an unknown food code.
+        """
+        row = self._food_code_to_row.get(food_code)
+        if row is None:
+            return None
+
+        return pl.Series(self._food_code_to_food_name[food_code], self._nutrient_matrix[row])
+
+    def _load_portions_and_weight(self):
+        """
+        Build the food unit map from `portions_and_weight_df`. The unit of a food is its first
+        listed portion with the leading quantity stripped, e.g. "1 cup" -> "cup".
+        """
+        columns = (
+            self.portions_and_weight_df
+            .sort(_FOOD_CODE, _SEQ_NUM)
+            .unique(_FOOD_CODE, keep="first", maintain_order=True)
+            .select(
+                _FOOD_CODE,
+                pl.col(_PORTION_DESCRIPTION).str.replace(r"^[\d./\s]+", "").alias(_UNIT),
+            )
+            .to_dict(as_series=False)
+        )
+        food_units = [sys.intern(unit) for unit in columns[_UNIT]]
+
+        self._food_unit_by_food_code = dict(zip(columns[_FOOD_CODE], food_units))
+
+    def _build_lookup_maps(self):
+        """
+        Compose the raw alias -> food code -> food name maps into direct maps, so that
+        lookups do not chain through an intermediate key (and a missing intermediate key
+        cannot leak into the next lookup).
+        """
+        # built in one shot from zip/map over the source maps, so the lookups run in C and no
+        # map grows key by key
+        self._food_name_to_food_code = dict(
+            zip(self._food_code_to_food_name.values(), self._food_code_to_food_name.keys())
+        )
+        self._alias_to_food_name = dict(zip(
+            self._alias_to_food_code.keys(),
+            map(self._food_code_to_food_name.get, self._alias_to_food_code.values()),
+        ))
+        self._food_code_to_alias = dict(zip(
+            self._food_code_to_food_name.keys(),
+            map(self._food_name_to_alias.get, self._food_code_to_food_name.values()),
+        ))
+        if self._food_code_to_row is not None:
+            self._alias_to_row = dict(zip(
+                self._alias_to_food_code.keys(),
+                map(self._food_code_to_row.__getitem__, self._alias_to_food_code.values()),
+            ))
+        if self._food_unit_by_food_code is not None:
+            self._food_unit_by_alias = dict(zip(
+                self._alias_to_food_code.keys(),
+                map(self._food_unit_by_food_code.get, self._alias_to_food_code.values()),
+            ))
+            self._food_unit_by_food_name = dict(zip(
+                self._food_name_to_food_code.keys(),
+                map(self._food_unit_by_food_code.get, self._food_name_to_food_code.values()),
+            ))
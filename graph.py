@@ -1,6 +1,19 @@
 from abc import abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import gc
 import logging
-from typing import Any
+import math
+from typing import Any, Callable, Iterator, List, Tuple
+import weakref
+import numpy as np
+import xxhash
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +49,12 @@ class Node(object):
     Cost computation
     ================
     Once a graph is flattened into a linear ordering, we sum up all costs of tasks in the ordering, with care taken to account for background tasks.
+    Tasks are started in order, each once all of its children have finished. A foreground task occupies the worker for its `span`,
+    while a background task only needs to be started and then runs alongside the tasks after it. The cost of the ordering is the
+    time at which the last task finishes.
+
+    The search is a dynamic program over the set of scheduled tasks and the remaining time of the background tasks still running,
+    with sets of tasks stored as bitmasks over the topologically numbered nodes (see `minimal_cost_ordering`).
 
     Merging
     =======
@@ -64,9 +83,18 @@ class Node(object):
     - A node has exactly one output. Multiple outputs are not implemented at the moment. Otherwise, the `Node`
     needs to specify output type.
     """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # register the node type, so validating a child is one dict lookup on its exact type
+        _NODE_TYPES.add(cls)
+        _CHILD_HANDLERS[cls] = _coerce_node
+
     def __init__(self):
         self._children = None
-        self._parents = None
+        self._children_flat = ()
+        # weak references, so parent <-> child edges are not reference cycles the garbage collector has to walk
+        self._parents: List[weakref.ref] = []
+        self._hash_cache = None
 
 
     @property
@@ -77,6 +105,14 @@ class Node(object):
         """
         pass
     
+    @property
+    @abstractmethod
+    def span(self) -> float:
+        """
+        Time cost of the task in seconds.
+        """
+        pass
+
     @property
     @abstractmethod
     def is_contractable(self) -> bool:
@@ -85,22 +121,49 @@ class Node(object):
         """
         pass
 
-    @property.setter
+    @is_contractable.setter
     @abstractmethod
-    def is_contractable(self, value: bool):
+    def is_contractable(self, value: bool) -> None:
         """
         Set the node as contractable.
         """
         pass
 
-    @abstractmethod
-    def get_hash(self) -> str:
+    def get_hash(self) -> int:
         """
         Get the hash of the node. The hash is a unique identifier for the node and its children resursively. 
         That is, the hash is a unique identifier for maximum subgraphs starting at the node.
 
-        Hash is dynamically computed, since graph might change.
+        Hash is computed by `compute_hash` once and cached. The cache of a node and of all its ancestors is
+        invalidated whenever the node's children are set, since graph might change.
         """
+        if self._hash_cache is None:
+            # fill the caches bottom-up, so compute_hash never recurses into an uncached child
+            for node in self._walk_post_order(prune=lambda n: n._hash_cache is not None):
+                node._hash_cache = node.compute_hash()
+        return self._hash_cache
+
+    @abstractmethod
+    def get_signature(self) -> bytes:
+        """
+        Get the serialized specs of the node itself, without its children. Two nodes with the same signature
+        and identical children are merged.
+        """
+        pass
+
+    def compute_hash(self) -> int:
+        """
+        Compute the hash of the node from its signature and the hashes of its children (via `get_hash`), including
+        the argument each child is passed as. Use `get_hash` instead of calling this method directly.
+
+        The hash is only used as a dict key when merging, so it is a 64 bit xxh3 integer rather than a cryptographic
+        digest.
+        """
+        parts = [self.get_signature()]
+        for kind, key, child in self._children_flat:
+            parts.append(f"{kind}{key!r}".encode())
+            parts.append(child.get_hash().to_bytes(8, "little"))
+        return xxhash.xxh3_64_intdigest(b"|".join(parts))
 
     def forward(self, *args, **kwargs) -> Any:
         """
@@ -126,34 +189,19 @@ class Node(object):
         if self._children is not None:
             logger.warning("Overwriting children of node %s", self)
 
-        _invalid_msg = "Invalid argument type. Expected Node or list/tuple/dict of Nodes."
-        _args = []
-        for arg in args:
-            if isinstance(arg, Node):
-                _args.append(arg)
-            elif isinstance(arg, (list, tuple)):
-                assert all(isinstance(i, Node) for i in arg), _invalid_msg
-                _args.append(arg)
-            elif isinstance(arg, dict):
-                assert all(isinstance(i, Node) for i in arg.values()), _invalid_msg
-                _args.append(arg)
-            else:
-                raise ValueError(_invalid_msg)
-            
-        _kwargs = {}
-        for key, value in kwargs.items():
-            if isinstance(value, Node):
-                _kwargs[key] = value
-            elif isinstance(value, (list, tuple)):
-                assert all(isinstance(i, Node) for i in value), _invalid_msg
-                _kwargs[key] = value
-            elif isinstance(value, dict):
-                assert all(isinstance(i, Node) for i in value.values()), _invalid_msg
-                _kwargs[key] = value
-            else:
-                raise ValueError(_invalid_msg)
-            
+        _args = [_coerce_child(arg) for arg in args]
+        _kwargs = {key: _coerce_child(value) for key, value in kwargs.items()}
+
+        if self._children is not None:
+            for child in self.get_children():
+                child._parents.remove(weakref.ref(self))
+
         self._children = (_args, _kwargs)
+        self._children_flat = _flatten_children(_args, _kwargs)
+
+        for child in self.get_children():
+            child._parents.append(weakref.ref(self))
+        self._invalidate_hash()
 
         return self
 
@@ -161,11 +209,672 @@ class Node(object):
     def get_children(self) -> list:
         """
         Get the children of the node. The children are the nodes that depend on this node.
+        Each child is listed once, in the order it was first passed to `__call__`.
         """
-        pass
+        return list(dict.fromkeys(child for _, _, child in self._children_flat))
 
+    def get_parents(self) -> list:
+        """
+        Get the parents of the node, i.e. the nodes that take this node as a child and are still alive.
+        """
+        parents = [ref() for ref in self._parents]
+        if None in parents:
+            # drop the references to parents that have been garbage collected
+            self._parents = [ref for ref, parent in zip(self._parents, parents) if parent is not None]
+        return [parent for parent in parents if parent is not None]
 
-    
+    def _walk_post_order(self, prune: Callable[["Node"], bool] = None) -> Iterator["Node"]:
+        """
+        Yield this node and every node below it once, each after all of its children. Nodes for which `prune`
+        returns True are skipped together with everything only reachable through them.
 
-    
+        The walk keeps an explicit stack instead of recursing, so deep graphs don't hit the recursion limit.
+        """
+        visited = {self}
+        stack = deque([(self, iter(self.get_children()))])
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in visited and (prune is None or not prune(child)):
+                    visited.add(child)
+                    stack.append((child, iter(child.get_children())))
+                    break
+            else:
+                stack.pop()
+                yield node
+
+    def _replace_child(self, old: "Node", new: "Node"):
+        """
+        Replace every occurrence of the child `old` by `new`, keeping the structure of the arguments.
+        """
+        _args, _kwargs = self._children
+        self._children = (
+            [_swap_child(arg, old, new) for arg in _args],
+            {key: _swap_child(value, old, new) for key, value in _kwargs.items()},
+        )
+        self._children_flat = tuple(
+            (kind, key, new if child is old else child) for kind, key, child in self._children_flat
+        )
+        ref = weakref.ref(self)
+        old._parents.remove(ref)
+        if ref not in new._parents:
+            new._parents.append(ref)
+
+    def _invalidate_hash(self):
+        """
+        Drop the cached hash of this node and of every node depending on it.
+        """
+        stack = [self]
+        visited = set()
+        while stack:
+            node = stack.pop()
+            if node in visited:
+                continue
+            visited.add(node)
+            node._hash_cache = None
+            stack.extend(node.get_parents())
+
+
+_INVALID_CHILD_MSG = "Invalid argument type. Expected Node or list/tuple/dict of Nodes."
+
+
+def _coerce_node(arg):
+    return arg
+
+
+def _coerce_sequence(arg):
+    assert all(type(i) in _NODE_TYPES for i in arg), _INVALID_CHILD_MSG
+    return arg
+
+
+def _coerce_dict(arg):
+    assert all(type(i) in _NODE_TYPES for i in arg.values()), _INVALID_CHILD_MSG
+    return arg
+
+
+# `Node` and all of its subclasses, kept up to date by `Node.__init_subclass__`
+_NODE_TYPES = {Node}
+
+# handlers, dispatched on the exact type of the argument. Node types come first as they are the
+# most common argument, and every subclass of `Node` is added when it is defined.
+_CHILD_HANDLERS = {
+    Node: _coerce_node,
+    list: _coerce_sequence,
+    tuple: _coerce_sequence,
+    dict: _coerce_dict,
+}
+
+
+def _coerce_child(arg):
+    """
+    Validate one argument passed to `Node.__call__` with a single dict lookup on its type.
+    """
+    handler = _CHILD_HANDLERS.get(type(arg))
+    if handler is None:
+        raise ValueError(_INVALID_CHILD_MSG)
+    return handler(arg)
+
+
+def _flatten_children(_args: list, _kwargs: dict) -> tuple:
+    """
+    Flatten validated `__call__` arguments into a tuple of `(kind, key, node)` triples, so that graph
+    traversals are a single loop without branching on the container types. `kind` is "pos" or "kw",
+    suffixed with "_list", "_tuple" or "_dict" for nodes inside a container, so that children passed
+    in different containers neither hash equal nor merge, and `key` locates the node, e.g.
+    `("kw_dict", (name, dict_key), node)`. `_children` keeps the nested structure for `forward`.
+    """
+    flat = []
+    for prefix, items in (("pos", enumerate(_args)), ("kw", _kwargs.items())):
+        for key, arg in items:
+            if type(arg) in _NODE_TYPES:
+                flat.append((prefix, key, arg))
+            elif type(arg) is dict:
+                flat.extend((f"{prefix}_dict", (key, k), node) for k, node in arg.items())
+            else:
+                kind = f"{prefix}_{type(arg).__name__}"
+                flat.extend((kind, (key, j), node) for j, node in enumerate(arg))
+    return tuple(flat)
+
+
+def _swap_child(arg, old: Node, new: Node):
+    if arg is old:
+        return new
+    if type(arg) in _NODE_TYPES:
+        return arg
+    if type(arg) is dict:
+        return {key: new if value is old else value for key, value in arg.items()}
+    return type(arg)(new if i is old else i for i in arg)
+
+
+def _is_same_node(a: Node, b: Node) -> bool:
+    """
+    Check whether `a` and `b` have the same signature and take the same child nodes as the same arguments.
+    """
+    if len(a._children_flat) != len(b._children_flat) or a.get_signature() != b.get_signature():
+        return False
+    return all(
+        kind_a == kind_b and key_a == key_b and child_a is child_b
+        for (kind_a, key_a, child_a), (kind_b, key_b, child_b) in zip(a._children_flat, b._children_flat)
+    )
+
+
+def merge_leaves_up(root: Node) -> Node:
+    """
+    Merge identical subgraphs of the graph rooted at `root`, see the `Merging` section of `Node`.
+
+    Nodes are visited from the leaves up and indexed by hash, so the first node seen with a given hash
+    is kept and every later node with the same hash is replaced by it in all of its parents. This is
+    a single dict lookup per node instead of comparing nodes pairwise.
+
+    A hash match is confirmed before merging, so that a hash collision never merges different subgraphs.
+    As children are merged first, two identical nodes have the same signature and the very same children.
+    """
+    table = {}
+    for node in list(root._walk_post_order()):
+        candidates = table.setdefault(node.get_hash(), [])
+        kept = next((candidate for candidate in candidates if _is_same_node(candidate, node)), None)
+        if kept is None:
+            candidates.append(node)
+            continue
+
+        for parent in node.get_parents():
+            parent._replace_child(node, kept)
+        for child in node.get_children():
+            child._parents.remove(weakref.ref(node))
+
+    return root
+
+
+def _index_graph(root: Node) -> Tuple[List[Node], List[int], List[float], List[bool]]:
+    """
+    Number the nodes of the graph rooted at `root` in topological order (children first) and describe each node by the
+    bitmask of its children, its span and whether it is a background task.
+    """
+    nodes = list(root._walk_post_order())
+    ids = {node: i for i, node in enumerate(nodes)}
+    dependency_masks = []
+    for node in nodes:
+        mask = 0
+        for child in node.get_children():
+            mask |= 1 << ids[child]
+        dependency_masks.append(mask)
+
+    return nodes, dependency_masks, [node.span for node in nodes], [node.is_background for node in nodes]
+
+
+def _mco_dp(dependency_masks: List[int], spans: List[float], is_background: List[bool]) -> Tuple[float, Tuple[int, ...]]:
+    """
+    Find the minimal cost ordering of the tasks `0..n-1`, where task `v` may only start once every task in
+    `dependency_masks[v]` is scheduled. Returns the cost and the ordering as a tuple of task ids.
+
+    The state is the bitmask of scheduled tasks and the background tasks still running, as sorted `(task, remaining time)`
+    pairs relative to the current time, which is all the cost of the remaining tasks depends on.
+    """
+    n = len(spans)
+    full = (1 << n) - 1
+    memo = {}
+
+    def best(scheduled: int, running: tuple) -> Tuple[float, Tuple[int, ...]]:
+        key = (scheduled, running)
+        if key in memo:
+            return memo[key]
+
+        if scheduled == full:
+            result = (max((remaining for _, remaining in running), default=0.0), ())
+        else:
+            result = (math.inf, ())
+            candidates = full & ~scheduled
+            while candidates:
+                bit = candidates & -candidates
+                candidates ^= bit
+                v = bit.bit_length() - 1
+                dependencies = dependency_masks[v]
+                if dependencies & ~scheduled:
+                    continue
+
+                wait = max((remaining for u, remaining in running if dependencies >> u & 1), default=0.0)
+                step = wait if is_background[v] else wait + spans[v]
+                next_running = tuple((u, remaining - step) for u, remaining in running if remaining > step)
+                if is_background[v] and spans[v] > 0:
+                    next_running = tuple(sorted(next_running + ((v, spans[v]),)))
+
+                cost, ordering = best(scheduled | bit, next_running)
+                if step + cost < result[0]:
+                    result = (step + cost, (v,) + ordering)
+
+        memo[key] = result
+        return result
+
+    return best(0, ())
+
+
+# largest graph, in tasks after contraction, for which a specialized MCO search is generated
+_MCO_CODEGEN_MAX_TASKS = 30
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_mco_dp(
+        dependency_masks: Tuple[int, ...],
+        spans: Tuple[float, ...],
+        is_background: Tuple[bool, ...],
+    ) -> Callable[[], Tuple[float, Tuple[int, ...]]]:
+    """
+    Generate and compile a version of `_mco_dp` specialized to one graph. The loop over candidate tasks is unrolled,
+    with each task's bits, dependency mask and span baked in as literals, so the search runs as straight-line code
+    without indexing into the graph description. Compiled searches are cached by graph structure.
+
+    Returns a function without arguments that runs the search and returns the same result as `_mco_dp`.
+    """
+    n = len(spans)
+    lines = [
+        "def solve():",
+        "    memo = {}",
+        "    def best(scheduled, running):",
+        "        key = (scheduled, running)",
+        "        result = memo.get(key)",
+        "        if result is not None:",
+        "            return result",
+        f"        if scheduled == {(1 << n) - 1}:",
+        "            result = (max([remaining for _, remaining in running], default=0.0), ())",
+        "        else:",
+        "            result = (inf, ())",
+    ]
+    for v in range(n):
+        bit, dependencies, span = 1 << v, dependency_masks[v], float(spans[v])
+        # ready: not scheduled yet and all dependencies scheduled
+        lines.append(f"            if scheduled & {bit | dependencies} == {dependencies}:")
+        if dependencies:
+            lines.append(
+                "                wait = max([remaining for u, remaining in running"
+                f" if {dependencies} >> u & 1], default=0.0)"
+            )
+        else:
+            lines.append("                wait = 0.0")
+        lines.append("                step = wait" if is_background[v] else f"                step = wait + {span!r}")
+        lines.append("                next_running = tuple([(u, remaining - step) for u, remaining in running if remaining > step])")
+        if is_background[v] and span > 0:
+            lines.append(f"                next_running = tuple(sorted(next_running + (({v}, {span!r}),)))")
+        lines += [
+            f"                cost, ordering = best(scheduled | {bit}, next_running)",
+            "                if step + cost < result[0]:",
+            f"                    result = (step + cost, ({v},) + ordering)",
+        ]
+    lines += [
+        "        memo[key] = result",
+        "        return result",
+        "    return best(0, ())",
+    ]
+
+    namespace = {"inf": math.inf}
+    exec(compile("\n".join(lines), "<mco>", "exec"), namespace)
+    return namespace["solve"]
+
+
+# largest graph, in tasks after contraction, whose task sets fit the int64 bitmasks of the JIT compiled search
+_MCO_JIT_MAX_TASKS = 62
+
+if numba is not None:
+    # memo key of `_mco_search`: the bitmasks of the scheduled and of the running tasks
+    _MCO_MEMO_KEY = numba.types.UniTuple(numba.types.int64, 2)
+
+    @numba.njit(cache=True, boundscheck=False)
+    def _mco_search(scheduled, running_tasks, running_remaining, dependency_masks, spans, is_background, memo):
+        """
+        Recursive step of `_mco_jit`, the same search as `_mco_dp`. `running_tasks` holds the background tasks still
+        running in ascending order and `running_remaining` their remaining times.
+
+        Like the `(scheduled, running)` key of `_mco_dp`, a state is memoized by the bitmasks of the scheduled and running
+        tasks together with the exact remaining times. `memo` is `(index, remaining, costs, orderings, next)`: `index` maps
+        the pair of bitmasks to the first of the entries with those bitmasks, which are chained through `next`.
+        """
+        index, memo_remaining, memo_costs, memo_orderings, memo_next = memo
+        running_mask = np.int64(0)
+        for i in range(running_tasks.shape[0]):
+            running_mask |= np.int64(1) << running_tasks[i]
+        key = (scheduled, running_mask)
+        entry = index[key] if key in index else -1
+        while entry >= 0:
+            if np.array_equal(memo_remaining[entry], running_remaining):
+                return memo_costs[entry], memo_orderings[entry]
+            entry = memo_next[entry]
+
+        n = spans.shape[0]
+        if scheduled == (np.int64(1) << n) - 1:
+            best_cost = 0.0
+            for i in range(running_remaining.shape[0]):
+                best_cost = max(best_cost, running_remaining[i])
+            return best_cost, np.empty(0, np.int64)
+
+        best_cost = np.inf
+        best_ordering = np.empty(0, np.int64)
+        for v in range(n):
+            bit = np.int64(1) << v
+            dependencies = dependency_masks[v]
+            if scheduled & (bit | dependencies) != dependencies:
+                continue
+
+            wait = 0.0
+            for i in range(running_tasks.shape[0]):
+                if (dependencies >> running_tasks[i]) & 1 and running_remaining[i] > wait:
+                    wait = running_remaining[i]
+            step = wait if is_background[v] else wait + spans[v]
+
+            start = is_background[v] and spans[v] > 0
+            count = 1 if start else 0
+            for i in range(running_remaining.shape[0]):
+                if running_remaining[i] > step:
+                    count += 1
+            next_tasks = np.empty(count, np.int64)
+            next_remaining = np.empty(count, np.float64)
+            j = 0
+            for i in range(running_remaining.shape[0]):
+                if start and running_tasks[i] > v:
+                    # keep the running tasks sorted, as in `_mco_dp`
+                    next_tasks[j] = v
+                    next_remaining[j] = spans[v]
+                    j += 1
+                    start = False
+                if running_remaining[i] > step:
+                    next_tasks[j] = running_tasks[i]
+                    next_remaining[j] = running_remaining[i] - step
+                    j += 1
+            if start:
+                next_tasks[j] = v
+                next_remaining[j] = spans[v]
+
+            cost, ordering = _mco_search(
+                scheduled | bit, next_tasks, next_remaining, dependency_masks, spans, is_background, memo
+            )
+            if step + cost < best_cost:
+                best_cost = step + cost
+                best_ordering = np.empty(ordering.shape[0] + 1, np.int64)
+                best_ordering[0] = v
+                best_ordering[1:] = ordering
+
+        memo_remaining.append(running_remaining.copy())
+        memo_costs.append(best_cost)
+        memo_orderings.append(best_ordering)
+        memo_next.append(index[key] if key in index else -1)
+        index[key] = len(memo_costs) - 1
+        return best_cost, best_ordering
+
+    @numba.njit(cache=True)
+    def _mco_jit(dependency_masks, spans, is_background):
+        """
+        JIT compiled version of `_mco_dp` over the arrays describing the graph. Returns the cost and the ordering as an array
+        of task ids.
+        """
+        memo = (
+            numba.typed.Dict.empty(key_type=_MCO_MEMO_KEY, value_type=numba.types.int64),
+            numba.typed.List.empty_list(numba.types.float64[:]),
+            numba.typed.List.empty_list(numba.types.float64),
+            numba.typed.List.empty_list(numba.types.int64[:]),
+            numba.typed.List.empty_list(numba.types.int64),
+        )
+        return _mco_search(
+            np.int64(0),
+            np.empty(0, np.int64),
+            np.empty(0, np.float64),
+            dependency_masks,
+            spans,
+            is_background,
+            memo,
+        )
+
+
+def _solve_mco(dependency_masks: List[int], spans: List[float], is_background: List[bool]) -> Tuple[float, Tuple[int, ...]]:
+    """
+    Run the MCO search with the JIT compiled search if numba is installed, else with a compiled, graph specific search for
+    small graphs and `_mco_dp` otherwise.
+    """
+    if numba is not None and len(spans) <= _MCO_JIT_MAX_TASKS:
+        cost, ordering = _mco_jit(
+            np.array(dependency_masks, dtype=np.int64),
+            np.array(spans, dtype=np.float64),
+            np.array(is_background, dtype=np.bool_),
+        )
+        return cost, tuple(ordering.tolist())
+    if len(spans) > _MCO_CODEGEN_MAX_TASKS:
+        return _mco_dp(dependency_masks, spans, is_background)
+
+    return _compile_mco_dp(tuple(dependency_masks), tuple(spans), tuple(is_background))()
+
+
+def _split_components(dependency_masks: List[int]) -> Tuple[List[List[int]], List[int]]:
+    """
+    Split the tasks into the sinks (tasks no other task depends on, usually just the root) and the weakly connected
+    components of the remaining tasks. Each list of task ids is sorted, and components are sorted by their first task.
+    """
+    n = len(dependency_masks)
+    component_of = list(range(n))
+
+    def find(v: int) -> int:
+        while component_of[v] != v:
+            component_of[v] = component_of[component_of[v]]
+            v = component_of[v]
+        return v
+
+    depended_on = 0
+    for mask in dependency_masks:
+        depended_on |= mask
+    sinks = [v for v in range(n) if not depended_on >> v & 1]
+
+    for v, mask in enumerate(dependency_masks):
+        if not depended_on >> v & 1:
+            continue
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            component_of[find(bit.bit_length() - 1)] = find(v)
+
+    components = {}
+    for v in range(n):
+        if depended_on >> v & 1:
+            components.setdefault(find(v), []).append(v)
+
+    return list(components.values()), sinks
+
+
+def _solve_mco_components(
+        dependency_masks: List[int],
+        spans: List[float],
+        is_background: List[bool],
+        max_workers: int = None,
+    ) -> Tuple[int, ...]:
+    """
+    Search the ordering of each weakly connected component below the sinks in a separate process, then run the
+    components one after the other followed by the sinks. Returns the ordering.
+
+    Each component's ordering is minimal on its own, but the concatenation is not a minimal ordering of the whole
+    graph when a background task of one component could overlap with the tasks of another.
+    """
+    components, sinks = _split_components(dependency_masks)
+    if len(components) <= 1:
+        return _solve_mco(dependency_masks, spans, is_background)[1]
+
+    component_masks, component_spans, component_is_background = [], [], []
+    for component in components:
+        index = {v: i for i, v in enumerate(component)}
+        masks = []
+        for v in component:
+            mask, local = dependency_masks[v], 0
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                local |= 1 << index[bit.bit_length() - 1]
+            masks.append(local)
+        component_masks.append(masks)
+        component_spans.append([spans[v] for v in component])
+        component_is_background.append([is_background[v] for v in component])
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_solve_mco, component_masks, component_spans, component_is_background))
+
+    ordering = []
+    for component, (_, component_ordering) in zip(components, results):
+        ordering.extend(component[i] for i in component_ordering)
+    return tuple(ordering + sinks)
+
+
+def _ordering_cost(ordering: List[int], dependency_masks: List[int], spans: List[float], is_background: List[bool]) -> float:
+    """
+    Cost of running the tasks in `ordering`, see the `Cost computation` section of `Node`.
+    """
+    now = 0.0
+    finish = [0.0] * len(spans)
+    for v in ordering:
+        dependencies = dependency_masks[v]
+        start = now
+        while dependencies:
+            bit = dependencies & -dependencies
+            dependencies ^= bit
+            start = max(start, finish[bit.bit_length() - 1])
+        finish[v] = start + spans[v]
+        now = start if is_background[v] else finish[v]
+
+    return max(finish, default=0.0)
+
+
+def _contract(
+        dependency_masks: List[int],
+        spans: List[float],
+        is_background: List[bool],
+        is_contractable: List[bool],
+    ) -> Tuple[List[List[int]], List[int], List[float], List[bool]]:
+    """
+    Contract the graph before searching for the MCO, see the `Contracting` section of `Node`.
+
+    An edge between two contractable foreground tasks is contracted if the dependent task is the only parent of the other,
+    or the other is the only child of the dependent task. Contracting such an edge never creates a cycle. Tasks are tracked
+    with a union-find over task ids, and the spans of contracted tasks add up. Background tasks are never contracted, since
+    they do not occupy the worker for their span.
+
+    A warning is logged for each group that is not a chain, and for each chain whose contraction made tasks outside of it
+    wait longer, i.e. where a task had a dependency or dependent outside the chain besides its neighbours in the chain.
+
+    Returns the groups of task ids (each in topological order) and the dependency masks, spans and background flags of the
+    groups.
+    """
+    n = len(spans)
+    group_of = list(range(n))
+
+    def find(v: int) -> int:
+        while group_of[v] != v:
+            group_of[v] = group_of[group_of[v]]
+            v = group_of[v]
+        return v
+
+    children = [set() for _ in range(n)]
+    parents = [set() for _ in range(n)]
+    for v, mask in enumerate(dependency_masks):
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            u = bit.bit_length() - 1
+            children[v].add(u)
+            parents[u].add(v)
+
+    fusable = [is_contractable[v] and not is_background[v] for v in range(n)]
+    group_spans = list(spans)
+    # whether the fusions into a group made tasks outside of it wait longer than before
+    constrained = [False] * n
+    edges = deque((u, v) for v in range(n) for u in sorted(children[v]) if fusable[u] and fusable[v])
+    while edges:
+        u, v = edges.popleft()
+        u, v = find(u), find(v)
+        if u == v or u not in children[v]:
+            continue
+        only_parent, only_child = parents[u] == {v}, children[v] == {u}
+        if not (only_parent or only_child):
+            continue
+
+        # fuse u into v
+        group_of[u] = v
+        group_spans[v] += group_spans[u]
+        constrained[v] = constrained[v] or constrained[u] or not (only_parent and only_child)
+        children[v].discard(u)
+        parents[u].discard(v)
+        for w in children[u]:
+            parents[w].discard(u)
+            parents[w].add(v)
+        for w in parents[u]:
+            children[w].discard(u)
+            children[w].add(v)
+        children[v] |= children[u]
+        parents[v] |= parents[u]
+        edges.extend((w, v) for w in sorted(children[v]) if fusable[w])
+        edges.extend((v, w) for w in sorted(parents[v]) if fusable[w])
+
+    groups = {}
+    for v in range(n):
+        groups.setdefault(find(v), []).append(v)
+    roots = list(groups)
+    index = {r: i for i, r in enumerate(roots)}
+
+    group_masks = []
+    for r in roots:
+        mask = 0
+        for u in children[r]:
+            mask |= 1 << index[u]
+        group_masks.append(mask)
+        if len(groups[r]) == 1:
+            continue
+
+        members = 0
+        for v in groups[r]:
+            members |= 1 << v
+        has_dependent = 0
+        chain = True
+        for v in groups[r]:
+            inner = dependency_masks[v] & members
+            chain = chain and inner & (inner - 1) == 0 and not has_dependent & inner
+            has_dependent |= inner
+        if not chain:
+            logger.warning(
+                "Contracted a nonlinear contractable subgraph of %d tasks; its internal ordering might not be optimal.",
+                len(groups[r]),
+            )
+        elif constrained[r]:
+            logger.warning(
+                "Contracted a chain of %d contractable tasks with dependencies or dependents outside its ends; the whole "
+                "chain now waits for all of its dependencies and its dependents wait for the whole chain, which might "
+                "not be optimal.",
+                len(groups[r]),
+            )
+
+    return (
+        [groups[r] for r in roots],
+        group_masks,
+        [group_spans[r] for r in roots],
+        [is_background[r] for r in roots],
+    )
+
+
+def minimal_cost_ordering(root: Node, max_workers: int = None) -> Tuple[List[Node], float]:
+    """
+    Find a minimal cost ordering (MCO) of the graph rooted at `root`, see the `Cost computation` section of `Node`.
+    Contractable tasks are contracted first, so the ordering is minimal among orderings that keep them together.
+    Returns the nodes in the order to run them and the cost of that ordering. Ties are broken deterministically.
+
+    If `max_workers` is given, the independent subgraphs below the root are searched in parallel in up to `max_workers`
+    processes and run one after the other. This is faster on wide graphs, but the ordering is then only minimal within
+    each subgraph, as background tasks are not overlapped across subgraphs.
+    """
+    nodes, dependency_masks, spans, is_background = _index_graph(root)
+    groups, group_masks, group_spans, group_is_background = _contract(
+        dependency_masks, spans, is_background, [node.is_contractable for node in nodes]
+    )
+    # the search allocates many small tuples but no cycles, so keep the garbage collector out of it
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if max_workers is None:
+            _, group_ordering = _solve_mco(group_masks, group_spans, group_is_background)
+        else:
+            group_ordering = _solve_mco_components(group_masks, group_spans, group_is_background, max_workers)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    ordering = [v for g in group_ordering for v in groups[g]]
 
+    return [nodes[v] for v in ordering], _ordering_cost(ordering, dependency_masks, spans, is_background)
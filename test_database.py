@@ -0,0 +1,190 @@
+import os
+
+import numpy as np
+import pytest
+
+import database
+from database import FnddsAPI
+
+DATA_ROOT = os.path.join(os.path.dirname(__file__), "data", "fndds")
+
+NUTRIENT_VALUES_CSV = '''"FNDDS Nutrient Values
+2021-2023 Food and Nutrient Database for Dietary Studies - At A Glance",,,,,
+Food code,Main food description,WWEIA Category number,WWEIA Category description,Energy (kcal),"Protein
+(g)"
+11111000,"Milk, whole",1002,"Milk, whole",61,3.27
+11100000,"Milk, NFS",1004,"Milk, reduced fat",52,3.33
+24300110,"Duck, cooked, skin eaten",2206,"Turkey, duck, other poultry",201,23.48
+'''
+
+PORTIONS_AND_WEIGHT_CSV = '''"Portions and Weights
+2021-2023 Food and Nutrient Database for Dietary Studies - At A Glance",,,,,,
+Food code,Main food description,WWEIA Category number,WWEIA Category description,Seq num,Portion description,"Portion weight
+(g)"
+11111000,"Milk, whole",1002,"Milk, whole",2,1 fl oz,30.5
+11111000,"Milk, whole",1002,"Milk, whole",1,1 cup,244
+11100000,"Milk, NFS",1004,"Milk, reduced fat",1,1 fl oz,30.5
+24300110,"Duck, cooked, skin eaten",2206,"Turkey, duck, other poultry",1,1/2 duck,380
+'''
+
+
+@pytest.fixture
+def fndds_files(tmp_path):
+    nutrient_values = tmp_path / "nutrient_values.csv"
+    nutrient_values.write_text(NUTRIENT_VALUES_CSV)
+    portions_and_weight = tmp_path / "portions_and_weight.csv"
+    portions_and_weight.write_text(PORTIONS_AND_WEIGHT_CSV)
+    return str(nutrient_values), str(portions_and_weight)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(database, "_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture
+def api(fndds_files):
+    return FnddsAPI(*fndds_files, use_cache=False)
+
+
+def test_nutrient_header_collapses_line_breaks(api):
+    assert api.nutrient_header == ("Energy (kcal)", "Protein (g)")
+
+
+def test_lookups_between_alias_food_code_and_food_name(api):
+    assert api.get_food_code(alias="milk, whole") == 11111000
+    assert api.get_food_code(food_name="Milk, NFS") == 11100000
+    assert api.get_food_name(alias="duck, cooked, skin eaten") == "Duck, cooked, skin eaten"
+    assert api.get_food_name(food_code=11111000) == "Milk, whole"
+    assert api.get_food_alias(food_code=11100000) == "milk, nfs"
+    assert api.get_food_alias(food_name="Milk, whole") == "milk, whole"
+
+    assert api.get_food_code(alias="unknown") is None
+    assert api.get_food_name(food_code=1) is None
+    with pytest.raises(ValueError):
+        api.get_food_code()
+
+
+def test_food_unit_is_first_portion_without_quantity(api):
+    assert api.get_food_unit(alist="milk, whole") == "cup"
+    assert api.get_food_unit(food_code=11100000) == "fl oz"
+    assert api.get_food_unit(food_name="Duck, cooked, skin eaten") == "duck"
+    assert api.get_food_unit(alist="unknown") is None
+    with pytest.raises(ValueError):
+        api.get_food_unit()
+
+
+def test_nutrient_lookups(api):
+    series = api.get_food_nutrient_series(alias="milk, nfs")
+    assert series.name == "Milk, NFS"
+    assert series.to_list() == pytest.approx([52, 3.33])
+    assert api.get_food_nutrient_series(food_code=1) is None
+
+    matrix = api.get_food_nutrient_matrix([11111000, 24300110])
+    assert matrix.dtype == np.float32
+    np.testing.assert_allclose(matrix, [[61, 3.27], [201, 23.48]], rtol=1e-6)
+    np.testing.assert_allclose(
+        api.get_food_nutrient_matrix_by_alias(["duck, cooked, skin eaten", "milk, whole"]),
+        [[201, 23.48], [61, 3.27]],
+        rtol=1e-6,
+    )
+    np.testing.assert_allclose(api.get_nutrient_column("Protein (g)"), [3.27, 3.33, 23.48], rtol=1e-6)
+    with pytest.raises(KeyError):
+        api.get_food_nutrient_matrix([1])
+
+
+def test_reads_shipped_xlsx_and_csv_tables():
+    pytest.importorskip("fastexcel")
+    from_xlsx = FnddsAPI(
+        os.path.join(DATA_ROOT, "Nutrient Values.xlsx"),
+        os.path.join(DATA_ROOT, "Portions and Weights.xlsx"),
+        use_cache=False,
+    )
+    from_csv = FnddsAPI(
+        os.path.join(DATA_ROOT, "Nutrient Values", "FNDDS Nutrient Values-Table 1.csv"),
+        os.path.join(DATA_ROOT, "Portions and Weights", "Portions and Weights-Table 1.csv"),
+        use_cache=False,
+    )
+
+    for api in (from_xlsx, from_csv):
+        assert api.get_food_name(alias="milk, whole") == "Milk, whole"
+        assert api.get_food_unit(food_code=11111000) == "cup"
+    assert from_xlsx.nutrient_header == from_csv.nutrient_header
+    np.testing.assert_array_equal(from_xlsx._nutrient_matrix, from_csv._nutrient_matrix)
+
+
+def assert_lookups(api):
+    assert api.get_food_code(alias="milk, whole") == 11111000
+    assert api.get_food_unit(food_name="Duck, cooked, skin eaten") == "duck"
+    np.testing.assert_allclose(api.get_food_nutrient_matrix([11100000]), [[52, 3.33]], rtol=1e-6)
+
+
+def test_second_load_hits_cache(fndds_files, cache_dir, monkeypatch):
+    parsed = FnddsAPI(*fndds_files)
+    assert parsed.nutrient_values_df is not None
+    assert len(list(cache_dir.glob("*.pkl"))) == 1
+    assert len(list(cache_dir.glob("*.npy"))) == 1
+
+    def fail(file_path):
+        raise AssertionError(f"parsed {file_path} despite the cache")
+
+    monkeypatch.setattr(database, "_read_fndds_table", fail)
+    cached = FnddsAPI(*fndds_files)
+
+    assert cached.nutrient_values_df is None
+    assert cached.portions_and_weight_df is None
+    assert cached.nutrient_header == parsed.nutrient_header
+    assert_lookups(cached)
+
+
+def test_touching_source_invalidates_cache(fndds_files, cache_dir):
+    FnddsAPI(*fndds_files)
+    stat = os.stat(fndds_files[1])
+    os.utime(fndds_files[1], (stat.st_atime, stat.st_mtime + 10))
+
+    api = FnddsAPI(*fndds_files)
+
+    assert api.nutrient_values_df is not None
+    assert len(list(cache_dir.glob("*.pkl"))) == 2
+    assert_lookups(api)
+
+
+def test_missing_matrix_falls_back_to_parsing(fndds_files, cache_dir):
+    FnddsAPI(*fndds_files)
+    (npy,) = cache_dir.glob("*.npy")
+    npy.unlink()
+
+    api = FnddsAPI(*fndds_files)
+
+    assert api.nutrient_values_df is not None
+    assert npy.exists()
+    assert_lookups(api)
+
+
+def test_corrupt_cache_falls_back_to_parsing(fndds_files, cache_dir):
+    FnddsAPI(*fndds_files)
+    (pkl,) = cache_dir.glob("*.pkl")
+    pkl.write_bytes(b"not a pickle")
+
+    api = FnddsAPI(*fndds_files)
+
+    assert api.nutrient_values_df is not None
+    assert_lookups(api)
+    assert FnddsAPI(*fndds_files).nutrient_values_df is None
+
+
+@pytest.mark.parametrize("column_major", [False, True])
+def test_nutrient_matrix_is_read_only_and_cached_matrix_is_memory_mapped(fndds_files, cache_dir, column_major):
+    parsed = FnddsAPI(*fndds_files, column_major=column_major)
+    cached = FnddsAPI(*fndds_files, column_major=column_major)
+
+    assert cached.nutrient_values_df is None
+    assert isinstance(cached._nutrient_matrix, np.memmap)
+    for api in (parsed, cached):
+        matrix = api._nutrient_matrix
+        assert matrix.flags.f_contiguous if column_major else matrix.flags.c_contiguous
+        assert not matrix.flags.writeable
+        with pytest.raises(ValueError):
+            api.get_nutrient_column("Energy (kcal)")[0] = 0
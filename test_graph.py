@@ -0,0 +1,261 @@
+import itertools
+import logging
+import random
+import weakref
+
+import numpy as np
+import pytest
+
+import graph
+from graph import (
+    Node,
+    _compile_mco_dp,
+    _contract,
+    _mco_dp,
+    _ordering_cost,
+    _solve_mco,
+    merge_leaves_up,
+    minimal_cost_ordering,
+)
+
+
+class Task(Node):
+    def __init__(self, name: str, span: float = 1.0, background: bool = False, contractable: bool = False):
+        super().__init__()
+        self.name = name
+        self._span = span
+        self._background = background
+        self._contractable = contractable
+
+    @property
+    def span(self) -> float:
+        return self._span
+
+    @property
+    def is_background(self) -> bool:
+        return self._background
+
+    @property
+    def is_contractable(self) -> bool:
+        return self._contractable
+
+    def get_signature(self) -> bytes:
+        return self.name.encode()
+
+
+def random_dag(rng: random.Random, n: int, background_rate: float):
+    """
+    Random DAG over tasks `0..n-1`, numbered in topological order.
+    """
+    dependency_masks = []
+    for v in range(n):
+        mask = 0
+        for u in range(v):
+            if rng.random() < 0.3:
+                mask |= 1 << u
+        dependency_masks.append(mask)
+    spans = [rng.choice([0.0, 0.5, 1.0, 2.0, 3.25, 5.0]) for _ in range(n)]
+    is_background = [rng.random() < background_rate for _ in range(n)]
+    return dependency_masks, spans, is_background
+
+
+def brute_force_cost(dependency_masks, spans, is_background) -> float:
+    best = 0.0 if not spans else float("inf")
+    for ordering in itertools.permutations(range(len(spans))):
+        scheduled = 0
+        for v in ordering:
+            if dependency_masks[v] & ~scheduled:
+                break
+            scheduled |= 1 << v
+        else:
+            best = min(best, _ordering_cost(list(ordering), dependency_masks, spans, is_background))
+    return best
+
+
+def search_variants():
+    variants = [
+        ("dp", _mco_dp),
+        ("codegen", lambda masks, spans, bg: _compile_mco_dp(tuple(masks), tuple(spans), tuple(bg))()),
+    ]
+    if graph.numba is not None:
+        def jit(masks, spans, bg):
+            cost, ordering = graph._mco_jit(
+                np.array(masks, dtype=np.int64), np.array(spans, dtype=np.float64), np.array(bg, dtype=np.bool_)
+            )
+            return cost, tuple(ordering.tolist())
+        variants.append(("jit", jit))
+    return variants
+
+
+@pytest.mark.parametrize("background_rate", [0.0, 0.4])
+@pytest.mark.parametrize("name, search", search_variants())
+def test_mco_search_matches_brute_force(name, search, background_rate):
+    rng = random.Random(background_rate)
+    for _ in range(100):
+        dependency_masks, spans, is_background = random_dag(rng, rng.randint(0, 6), background_rate)
+        cost, ordering = search(dependency_masks, spans, is_background)
+
+        assert sorted(ordering) == list(range(len(spans)))
+        assert cost == pytest.approx(_ordering_cost(list(ordering), dependency_masks, spans, is_background))
+        assert cost == pytest.approx(brute_force_cost(dependency_masks, spans, is_background))
+
+
+@pytest.mark.skipif(graph.numba is None, reason="requires numba")
+def test_mco_search_memoizes_states_with_running_background_tasks():
+    # independent background tasks under one root: 12! orderings, but only one state per subset of started tasks
+    n = 12
+    dependency_masks = [0] * n + [(1 << n) - 1]
+    spans = [1.0 + 0.37 * i for i in range(n)] + [1.0]
+    is_background = [True] * n + [False]
+    numba = graph.numba
+    memo = (
+        numba.typed.Dict.empty(key_type=graph._MCO_MEMO_KEY, value_type=numba.types.int64),
+        numba.typed.List.empty_list(numba.types.float64[:]),
+        numba.typed.List.empty_list(numba.types.float64),
+        numba.typed.List.empty_list(numba.types.int64[:]),
+        numba.typed.List.empty_list(numba.types.int64),
+    )
+
+    cost, ordering = graph._mco_search(
+        np.int64(0),
+        np.empty(0, np.int64),
+        np.empty(0, np.float64),
+        np.array(dependency_masks, dtype=np.int64),
+        np.array(spans, dtype=np.float64),
+        np.array(is_background, dtype=np.bool_),
+        memo,
+    )
+
+    assert len(memo[2]) == 2 ** n
+    assert (cost, tuple(ordering.tolist())) == _mco_dp(dependency_masks, spans, is_background)
+    assert _solve_mco(dependency_masks, spans, is_background) == _mco_dp(dependency_masks, spans, is_background)
+
+
+def test_minimal_cost_ordering_respects_dependencies():
+    rng = random.Random(0)
+    for _ in range(50):
+        n = rng.randint(1, 7)
+        tasks = [
+            Task(f"t{i}", rng.choice([0.5, 1.0, 2.0]), rng.random() < 0.3, rng.random() < 0.5) for i in range(n)
+        ]
+        for i in range(1, n):
+            children = [tasks[j] for j in range(i) if rng.random() < 0.4]
+            if children:
+                tasks[i](*children)
+        root = Task("root")(*tasks)
+
+        ordering, cost = minimal_cost_ordering(root)
+
+        position = {node: i for i, node in enumerate(ordering)}
+        assert len(position) == n + 1
+        assert all(position[child] < position[node] for node in ordering for child in node.get_children())
+        assert cost > 0
+
+
+def test_merge_leaves_up_merges_duplicate_leaves_and_subtrees():
+    a1, a2 = Task("a"), Task("a")
+    b1, b2 = Task("b")(a1), Task("b")(a2)
+    c = Task("c")(a2)
+    root = Task("root")(b1, c, deps=[b2])
+
+    assert merge_leaves_up(root) is root
+
+    assert root._children == ([b1, c], {"deps": [b1]})
+    assert root._children_flat == (("pos", 0, b1), ("pos", 1, c), ("kw_list", ("deps", 0), b1))
+    assert root.get_children() == [b1, c]
+    assert c._children == ([a1], {})
+    assert c._children_flat == (("pos", 0, a1),)
+
+    assert b1._parents == [weakref.ref(root)]
+    assert b2._parents == []
+    assert a1._parents == [weakref.ref(b1), weakref.ref(c)]
+    assert a2._parents == []
+    assert b2.get_children() == [a1]
+
+
+def test_merge_leaves_up_keeps_one_parent_reference_for_a_parent_of_both_duplicates():
+    x1, x2 = Task("x"), Task("x")
+    parent = Task("parent")(x1, x2)
+    root = Task("root")(parent)
+
+    merge_leaves_up(root)
+
+    assert parent._children == ([x1, x1], {})
+    assert parent._children_flat == (("pos", 0, x1), ("pos", 1, x1))
+    assert parent.get_children() == [x1]
+    assert x1._parents == [weakref.ref(parent)]
+    assert x2._parents == []
+
+
+def test_merge_leaves_up_does_not_merge_on_hash_collision(monkeypatch):
+    monkeypatch.setattr(Task, "compute_hash", lambda self: 0)
+    a, b, a_copy = Task("a"), Task("b"), Task("a")
+    root = Task("root")(a, b, a_copy)
+
+    merge_leaves_up(root)
+
+    assert root._children == ([a, b, a], {})
+    assert root.get_children() == [a, b]
+    assert b._parents == [weakref.ref(root)]
+
+
+@pytest.mark.parametrize(
+    "containers", [(list, tuple), (lambda nodes: dict(enumerate(nodes)), list)], ids=["list-tuple", "dict-list"]
+)
+def test_children_in_different_containers_are_not_merged(containers):
+    leaf = Task("leaf")
+    wraps = [Task("wrap")(wrap([leaf])) for wrap in containers]
+    root = Task("root")(*wraps)
+
+    assert wraps[0].get_hash() != wraps[1].get_hash()
+    merge_leaves_up(root)
+    assert root.get_children() == wraps
+
+
+def contract_with_warnings(caplog, dependency_masks, spans, is_contractable):
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="graph"):
+        result = _contract(dependency_masks, spans, [False] * len(spans), is_contractable)
+    return result, [record.getMessage() for record in caplog.records]
+
+
+def test_contract_chain(caplog):
+    # 0 <- 1 <- 2
+    result, warnings = contract_with_warnings(caplog, [0, 0b1, 0b10], [1.0, 2.0, 3.0], [True] * 3)
+
+    assert result == ([[0, 1, 2]], [0], [6.0], [False])
+    assert warnings == []
+
+
+def test_contract_docstring_example(caplog):
+    # A -> B -> C and E -> F -> G are contracted, D depends on both chains
+    a, b, c, e, f, g, d = range(7)
+    dependency_masks = [0, 1 << a, 1 << b, 0, 1 << e, 1 << f, (1 << c) | (1 << g)]
+    result, warnings = contract_with_warnings(caplog, dependency_masks, [1.0] * 7, [True] * 6 + [False])
+
+    assert result == ([[a, b, c], [e, f, g], [d]], [0, 0, 0b11], [3.0, 3.0, 1.0], [False] * 3)
+    assert warnings == []
+
+
+def test_contract_only_parent(caplog):
+    # 1 only has the parent 2, which also depends on the uncontractable 0
+    result, warnings = contract_with_warnings(caplog, [0, 0, 0b11], [1.0, 2.0, 3.0], [False, True, True])
+
+    assert result == ([[0], [1, 2]], [0, 0b1], [1.0, 5.0], [False, False])
+    assert len(warnings) == 1 and warnings[0].startswith("Contracted a chain of 2")
+
+
+def test_contract_only_child(caplog):
+    # 1 only has the child 0, which is also a child of the uncontractable 2
+    result, warnings = contract_with_warnings(caplog, [0, 0b1, 0b1], [1.0, 2.0, 3.0], [True, True, False])
+
+    assert result == ([[0, 1], [2]], [0, 0b1], [3.0, 3.0], [False, False])
+    assert len(warnings) == 1 and warnings[0].startswith("Contracted a chain of 2")
+
+
+def test_contract_nonlinear(caplog):
+    # diamond 0 <- {1, 2} <- 3
+    result, warnings = contract_with_warnings(caplog, [0, 0b1, 0b1, 0b110], [1.0] * 4, [True] * 4)
+
+    assert result == ([[0, 1, 2, 3]], [0], [4.0], [False])
+    assert len(warnings) == 1 and warnings[0].startswith("Contracted a nonlinear contractable subgraph of 4")